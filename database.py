@@ -5,9 +5,11 @@ MongoDB helper functions ready to use in your backend code.
 Import and use these functions in your API endpoints for database operations.
 """
 
-from pymongo import MongoClient
+from pymongo import AsyncMongoClient
 from datetime import datetime, timezone
+import asyncio
 import os
+import time
 from dotenv import load_dotenv
 from typing import Union
 from pydantic import BaseModel
@@ -16,17 +18,58 @@ from pydantic import BaseModel
 load_dotenv()
 
 _client = None
-db = None
+_db = None
+
+# (fetched_at, names) for collection_names(); refreshed at most once per TTL
+_collections_cache = None
+_collections_lock = asyncio.Lock()
 
 database_url = os.getenv("DATABASE_URL")
 database_name = os.getenv("DATABASE_NAME")
 
-if database_url and database_name:
-    _client = MongoClient(database_url)
-    db = _client[database_name]
+def connect():
+    """Return the database handle, creating the async client on first use.
+
+    The client binds to the running event loop, so it is created from inside
+    the app lifespan (or another coroutine) rather than at import time.
+    """
+    global _client, _db
+    if _db is None and database_url and database_name:
+        # Keep the per-process pool small: N workers x maxPoolSize sockets
+        # must fit within the server's connection limit. 0 means unlimited.
+        max_pool = int(os.getenv("MONGO_POOL_SIZE", "20")) or None
+        _client = AsyncMongoClient(
+            database_url,
+            maxPoolSize=max_pool,
+            minPoolSize=min(2, max_pool) if max_pool else 2,
+            serverSelectionTimeoutMS=5000,
+        )
+        _db = _client[database_name]
+    return _db
+
+async def close_client():
+    """Close the shared client so the next connect() starts fresh"""
+    global _client, _db, _collections_cache
+    if _client is not None:
+        await _client.close()
+    _client = None
+    _db = None
+    _collections_cache = None
+
+async def collection_names(db, ttl: float = 30):
+    """Get collection names, cached in-process for `ttl` seconds"""
+    global _collections_cache
+    if db is None:
+        return []
+
+    async with _collections_lock:
+        if _collections_cache is None or time.monotonic() - _collections_cache[0] >= ttl:
+            _collections_cache = (time.monotonic(), await db.list_collection_names())
+        names = _collections_cache[1]
+    return list(names)
 
 # Helper functions for common database operations
-def create_document(collection_name: str, data: Union[BaseModel, dict]):
+async def create_document(db, collection_name: str, data: Union[BaseModel, dict]):
     """Insert a single document with timestamp"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
@@ -40,10 +83,10 @@ def create_document(collection_name: str, data: Union[BaseModel, dict]):
     data_dict['created_at'] = datetime.now(timezone.utc)
     data_dict['updated_at'] = datetime.now(timezone.utc)
 
-    result = db[collection_name].insert_one(data_dict)
+    result = await db[collection_name].insert_one(data_dict)
     return str(result.inserted_id)
 
-def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
+async def get_documents(db, collection_name: str, filter_dict: dict = None, limit: int = None):
     """Get documents from collection"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
@@ -52,4 +95,4 @@ def get_documents(collection_name: str, filter_dict: dict = None, limit: int = N
     if limit:
         cursor = cursor.limit(limit)
     
-    return list(cursor)
+    return await cursor.to_list(length=None)
@@ -1,22 +1,83 @@
+import logging
 import os
-from typing import List, Optional, Dict, Any
-from fastapi import FastAPI, UploadFile, File, Form
+import re
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Annotated, AsyncIterator, List, Optional, Dict, Any
+import orjson
+from fastapi import BackgroundTasks, Depends, FastAPI, HTTPException, Path, Query, Request, Response, UploadFile, File, Form
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from database import db, create_document, get_documents
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, PlainValidator, WithJsonSchema
+from async_lru import alru_cache
+from database import connect, close_client, collection_names, create_document
 from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo.errors import BulkWriteError
 
-app = FastAPI(title="Lily — Your AI Recruiter (MVP)")
+logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One shared client per process, created inside the running event loop
+    app.state.db = connect()
+    await seed_roles(app.state.db)
+    try:
+        yield
+    finally:
+        await close_client()
+
+async def get_db(request: Request):
+    return request.app.state.db
+
+app = FastAPI(title="Lily — Your AI Recruiter (MVP)", default_response_class=ORJSONResponse, lifespan=lifespan)
+
+# Credentials cannot be combined with a "*" origin, so origins are listed
+# explicitly: CORS_ORIGIN is comma-separated, CORS_ORIGIN_REGEX is optional.
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=[o.strip() for o in os.getenv("CORS_ORIGIN", "http://localhost:3000").split(",") if o.strip()],
+    allow_origin_regex=os.getenv("CORS_ORIGIN_REGEX"),
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
 # --------- Helpers ---------
+# Ids are validated at the edge so malformed values get a 422 instead of an
+# InvalidId 500 from inside the handler.
+OBJECT_ID_PATTERN = r"^[0-9a-fA-F]{24}$"
+
+def _parse_object_id(value: Any) -> ObjectId:
+    if isinstance(value, ObjectId):
+        return value
+    try:
+        return ObjectId(value)
+    except (InvalidId, TypeError):
+        raise ValueError("must be a 24-character hex ObjectId") from None
+
+# Model field parsed to an ObjectId once during validation; documented as a string
+PyObjectId = Annotated[
+    ObjectId,
+    PlainValidator(_parse_object_id),
+    WithJsonSchema({"type": "string", "pattern": OBJECT_ID_PATTERN}),
+]
+
+_PARAM_LOCATIONS = {"path": Path, "query": Query}
+
+def object_id_param(name: str, where: str = "path"):
+    """Dependency parsing the `name` path/query parameter into an ObjectId once"""
+    location = _PARAM_LOCATIONS[where]
+    async def parse(value: str = location(alias=name, pattern=OBJECT_ID_PATTERN)) -> ObjectId:
+        try:
+            return _parse_object_id(value)
+        except ValueError as e:
+            raise RequestValidationError(
+                [{"type": "value_error", "loc": (where, name), "msg": str(e), "input": value}]
+            ) from None
+    return parse
+
 class RoleCreate(BaseModel):
     title: str
     department: Optional[str] = None
@@ -32,7 +93,7 @@ class ApplicantCreate(BaseModel):
     resume_text: Optional[str] = None
 
 class ChatTurn(BaseModel):
-    interview_id: str
+    interview_id: PyObjectId
     message: str
 
 class CodingRunRequest(BaseModel):
@@ -41,13 +102,46 @@ class CodingRunRequest(BaseModel):
     code: str
     input: Optional[str] = ""
 
+FRONTEND_KWS = frozenset(("react", "frontend", "ui"))
+BACKEND_KWS = frozenset(("python", "backend", "api"))
+_WORD_RE = re.compile(r"[a-z]+")
+
+async def stream_json_list(key: str, cursor, headers: Optional[Dict[str, str]] = None) -> StreamingResponse:
+    """Stream `{"<key>": [...]}` row by row from an async cursor.
+
+    The first row is fetched before the response starts, so query and
+    connection errors still surface as a 5xx rather than a truncated 200.
+    """
+    try:
+        first = await anext(cursor, None)
+    except BaseException:
+        await cursor.close()
+        raise
+
+    async def body() -> AsyncIterator[bytes]:
+        try:
+            yield b'{"' + key.encode() + b'":['
+            if first is not None:
+                yield orjson.dumps(first)
+                async for doc in cursor:
+                    yield b"," + orjson.dumps(doc)
+            yield b"]}"
+        finally:
+            await cursor.close()
+    return StreamingResponse(body(), media_type="application/json", headers=headers)
+
 # --------- Seed roles if empty ---------
-@app.on_event("startup")
-async def seed_roles():
+# Every worker runs this on startup. Seed rows carry `seed: True` and a partial
+# unique index on their title makes concurrent seeding safe; duplicate-key
+# failures from the losers are ignored. User-created roles are unconstrained.
+async def seed_roles(db):
     try:
         if db is None:
             return
-        if "role" not in db.list_collection_names() or db["role"].count_documents({}) == 0:
+        await db["role"].create_index(
+            "title", unique=True, name="seed_title_unique", partialFilterExpression={"seed": True}
+        )
+        if await db["role"].estimated_document_count() == 0:
             roles = [
                 {
                     "title": "Frontend Engineer",
@@ -74,10 +168,17 @@ async def seed_roles():
                     "requirements": ["SQL", "Python", "Visualization"],
                 },
             ]
+            now = datetime.now(timezone.utc)
             for r in roles:
-                create_document("role", r)
+                r["seed"] = True
+                r["created_at"] = r["updated_at"] = now
+            try:
+                await db["role"].insert_many(roles, ordered=False)
+            except BulkWriteError as e:
+                if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                    raise
     except Exception:
-        pass
+        logger.exception("Seeding roles failed")
 
 # --------- Basic routes ---------
 @app.get("/")
@@ -85,7 +186,7 @@ def read_root():
     return {"message": "Lily backend running"}
 
 @app.get("/test")
-def test_database():
+async def test_database(db=Depends(get_db)):
     response = {
         "backend": "✅ Running",
         "database": "❌ Not Available",
@@ -96,79 +197,108 @@ def test_database():
     try:
         if db is not None:
             response["database"] = "✅ Connected"
-            response["collections"] = db.list_collection_names()
+            response["collections"] = await collection_names(db)
     except Exception as e:
         response["database"] = f"⚠️ {str(e)[:60]}"
     return response
 
 # --------- Roles ---------
+# Shape role documents server-side so rows arrive ready to serialize.
+ROLE_PROJECTION = {
+    "_id": 0,
+    "id": {"$toString": "$_id"},
+    "title": 1,
+    "department": 1,
+    "location": 1,
+    "level": 1,
+    "description": 1,
+    "requirements": 1,
+    "created_at": 1,
+    "updated_at": 1,
+}
+
+# Let browsers and CDNs/reverse proxies absorb role reads. Edits show up
+# within max-age; bump the URL or purge upstream for immediate changes.
+ROLES_CACHE_HEADERS = {"Cache-Control": "public, max-age=60, stale-while-revalidate=600"}
+
 @app.get("/api/roles")
-def list_roles():
-    items = get_documents("role") if db else []
-    for it in items:
-        it["id"] = str(it.pop("_id"))
-    return {"roles": items}
+async def list_roles(db=Depends(get_db)):
+    if db is None:
+        return {"roles": []}
+    cursor = await db["role"].aggregate([{"$project": ROLE_PROJECTION}])
+    return await stream_json_list("roles", cursor, headers=ROLES_CACHE_HEADERS)
+
+# Roles are near-static; cache lookups per process and clear on create.
+@alru_cache(maxsize=256, ttl=300)
+async def _fetch_role(db, role_oid: ObjectId):
+    return await db["role"].find_one({"_id": role_oid}, ROLE_PROJECTION)
 
 @app.get("/api/roles/{role_id}")
-def get_role(role_id: str):
+async def get_role(response: Response, role_oid: ObjectId = Depends(object_id_param("role_id")), db=Depends(get_db)):
     if db is None:
         return {"role": None}
-    item = db["role"].find_one({"_id": ObjectId(role_id)})
-    if not item:
-        return {"role": None}
-    item["id"] = str(item.pop("_id"))
+    item = await _fetch_role(db, role_oid)
+    if item is not None:
+        response.headers.update(ROLES_CACHE_HEADERS)
     return {"role": item}
 
 @app.post("/api/roles")
-def create_role(role: RoleCreate):
-    rid = create_document("role", role.model_dump())
+async def create_role(role: RoleCreate, db=Depends(get_db)):
+    rid = await create_document(db, "role", role.model_dump())
+    _fetch_role.cache_clear()
     return {"id": rid}
 
 # --------- Applicants / Application ---------
 @app.post("/api/apply")
-def apply(applicant: ApplicantCreate):
-    aid = create_document("applicant", applicant.model_dump())
+async def apply(applicant: ApplicantCreate, db=Depends(get_db)):
+    aid = await create_document(db, "applicant", applicant.model_dump())
     return {"applicant_id": aid, "suggested_roles": ["Frontend Engineer", "Backend Engineer"]}
 
 # File upload mock (resume)
 @app.post("/api/upload-resume")
 async def upload_resume(file: UploadFile = File(...)):
-    # Mock: read bytes and pretend to extract text
-    content = await file.read()
-    extracted_text = f"Extracted {len(content)} bytes of resume text. Skills: React, Python, SQL"
+    # Mock: count bytes in 1 MiB chunks and pretend to extract text
+    total = 0
+    while chunk := await file.read(1 << 20):
+        total += len(chunk)
+    extracted_text = f"Extracted {total} bytes of resume text. Skills: React, Python, SQL"
     return {"resume_text": extracted_text}
 
 # --------- Interview flow (mock AI) ---------
 @app.post("/api/interview/start")
-def start_interview(applicant_id: str, role_id: str):
-    iid = create_document("interview", {
+async def start_interview(applicant_id: str, role_id: str, db=Depends(get_db)):
+    iid = await create_document(db, "interview", {
         "applicant_id": applicant_id,
         "role_id": role_id,
         "mode": "chat",
         "messages": [
             {"sender": "lily", "text": "Hi! I’m Lily. Tell me about yourself."}
-        ]
+        ],
+        "started_at": datetime.now(timezone.utc),
     })
     return {"interview_id": iid}
 
 @app.post("/api/interview/chat")
-def chat(turn: ChatTurn):
+async def chat(turn: ChatTurn, db=Depends(get_db)):
     # Mock conversation: echo + simple branching
     user_msg = turn.message.strip()
     reply = "Thanks! Can you share a challenging project you led?"
-    if any(k in user_msg.lower() for k in ["react", "frontend", "ui"]):
+    tokens = set(_WORD_RE.findall(user_msg.lower()))
+    if tokens & FRONTEND_KWS:
         reply = "Great frontend background. How do you manage state at scale?"
-    elif any(k in user_msg.lower() for k in ["python", "backend", "api"]):
+    elif tokens & BACKEND_KWS:
         reply = "Nice backend focus. How do you design resilient APIs?"
-    if db:
-        db["interview"].update_one({"_id": ObjectId(turn.interview_id)}, {"$push": {"messages": {"sender": "candidate", "text": user_msg}}})
-        db["interview"].update_one({"_id": ObjectId(turn.interview_id)}, {"$push": {"messages": {"sender": "lily", "text": reply}}})
+    if db is not None:
+        await db["interview"].update_one({"_id": turn.interview_id}, {"$push": {"messages": {"$each": [
+            {"sender": "candidate", "text": user_msg},
+            {"sender": "lily", "text": reply},
+        ]}}})
     return {"reply": reply}
 
 @app.post("/api/interview/coding/start")
-def start_coding(interview_id: str):
-    if db:
-        db["interview"].update_one({"_id": ObjectId(interview_id)}, {"$set": {"mode": "coding"}})
+async def start_coding(interview_oid: ObjectId = Depends(object_id_param("interview_id", "query")), db=Depends(get_db)):
+    if db is not None:
+        await db["interview"].update_one({"_id": interview_oid}, {"$set": {"mode": "coding"}})
     starter = "// Write a function to reverse a string\nfunction solve(s){\n  return s.split('').reverse().join('')\n}\nconsole.log(solve('hello'))\n"
     return {"starter_code": starter, "language": "javascript"}
 
@@ -183,7 +313,20 @@ def run_code(req: CodingRunRequest):
     return {"stdout": output}
 
 @app.post("/api/interview/complete")
-def complete(interview_id: str):
+async def complete(
+    background_tasks: BackgroundTasks,
+    interview_oid: ObjectId = Depends(object_id_param("interview_id", "query")),
+    db=Depends(get_db),
+):
+    # Persist a pending result and score out-of-band so the request returns
+    # immediately. Move to a real queue (Celery/RQ/arq) once scoring is an LLM call.
+    if db is not None and await db["interview"].find_one({"_id": interview_oid}, {"_id": 1}) is None:
+        raise HTTPException(status_code=404, detail="Interview not found")
+    rid = await create_document(db, "result", {"interview_id": str(interview_oid), "status": "pending"})
+    background_tasks.add_task(score_interview, db, rid)
+    return {"result_id": rid, "status": "pending"}
+
+async def score_interview(db, result_id: str):
     # Mock scoring
     result = {
         "communication": 82,
@@ -191,29 +334,62 @@ def complete(interview_id: str):
         "technical": 88,
         "summary": "Strong fundamentals, clear communication. Consider deeper system design practice."
     }
-    rid = create_document("result", {"interview_id": interview_id, **result})
-    return {"result_id": rid, **result}
+    result_oid = ObjectId(result_id)
+    try:
+        await db["result"].update_one(
+            {"_id": result_oid},
+            {"$set": {**result, "status": "completed", "updated_at": datetime.now(timezone.utc)}},
+        )
+    except Exception:
+        logger.exception("Scoring result %s failed", result_id)
+        try:
+            await db["result"].update_one(
+                {"_id": result_oid},
+                {"$set": {"status": "failed", "updated_at": datetime.now(timezone.utc)}},
+            )
+        except Exception:
+            logger.exception("Could not mark result %s as failed", result_id)
+
+@app.get("/api/results/{result_id}")
+async def get_result(result_oid: ObjectId = Depends(object_id_param("result_id")), db=Depends(get_db)):
+    if db is None:
+        return {"result": None}
+    item = await db["result"].find_one(
+        {"_id": result_oid},
+        {
+            "_id": 0, "id": {"$toString": "$_id"}, "interview_id": 1, "status": 1,
+            "communication": 1, "problem_solving": 1, "technical": 1, "summary": 1, "created_at": 1,
+        },
+    )
+    return {"result": item}
 
 # --------- Admin mocks ---------
+# Ids are stringified server-side so rows stream straight to orjson.
 @app.get("/api/admin/applicants")
-def admin_applicants():
-    if not db:
+async def admin_applicants(db=Depends(get_db)):
+    if db is None:
         return {"applicants": []}
-    apps = list(db["applicant"].find().limit(50))
-    for a in apps:
-        a["id"] = str(a.pop("_id"))
-    return {"applicants": apps}
+    cursor = db["applicant"].find(
+        {}, {"_id": 0, "id": {"$toString": "$_id"}, "name": 1, "email": 1, "role_id": 1, "created_at": 1}
+    ).limit(50)
+    return await stream_json_list("applicants", cursor)
 
 @app.get("/api/admin/interviews")
-def admin_interviews():
-    if not db:
+async def admin_interviews(db=Depends(get_db)):
+    if db is None:
         return {"interviews": []}
-    items = list(db["interview"].find().limit(50))
-    for it in items:
-        it["id"] = str(it.pop("_id"))
-    return {"interviews": items}
+    cursor = db["interview"].find(
+        {}, {
+            "_id": 0, "id": {"$toString": "$_id"}, "applicant_id": 1, "role_id": 1, "mode": 1,
+            "started_at": 1, "created_at": 1,
+        }
+    ).limit(50)
+    return await stream_json_list("interviews", cursor)
 
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # One worker process per core; override with WEB_CONCURRENCY. In production
+    # prefer: gunicorn -k uvicorn.workers.UvicornWorker -w $((2 * CPUS + 1)) main:app
+    workers = int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+    uvicorn.run("main:app", host="0.0.0.0", port=port, workers=workers)
@@ -44,4 +44,5 @@ class Result(BaseModel):
     problem_solving: int = Field(0, ge=0, le=100)
     technical: int = Field(0, ge=0, le=100)
     summary: str = Field("", description="Feedback summary")
+    status: str = Field("pending", description="pending|completed|failed")
     created_at: Optional[datetime] = None